@@ -1,12 +1,30 @@
 # -*- coding: utf-8 -*-
 import os
-import xml.etree.ElementTree as ET
+import functools
 import json
 import re
 import argparse
 from pathlib import Path
 import logging
 
+try:
+    # 优先使用 lxml（libxml2 实现，接口与 ElementTree 兼容），未安装时回退到标准库
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+try:
+    # orjson 可用时用于加速 JSON 读取；写入仍使用标准库，以保持现有的 4 空格缩进格式
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# 写 JSON 时复用同一个编码器，格式与 json.dump(indent=4, ensure_ascii=False) 一致
+JSON_ENCODER = json.JSONEncoder(indent=4, ensure_ascii=False)
+
 # ====== 全局可配置项 ======
 # 修改此处即可更换编译器路径
 COMPILER_PATH = "C:/Users/25799/Documents/gcc-arm-none-eabi-10.3-2021.10/bin/arm-none-eabi-gcc.exe"
@@ -26,6 +44,18 @@ trim_trailing_whitespace = true
 insert_final_newline = true
 """
 
+# 解析 .uvprojx 时关心的标签；使用 lxml 时由 iterparse 在 C 层过滤掉其余元素的事件
+UVPROJX_TAGS = ('Target', 'TargetName', 'Cads', 'VariousControls', 'IncludePath', 'Define')
+
+# 匹配路径开头连续的 '../' 前缀
+DOTDOT_RE = re.compile(r'^(?:\.\./)+')
+
+# 将 Windows 分隔符 \ 统一替换为 /
+SLASH_TABLE = str.maketrans('\\', '/')
+
+# 按 ';' 切分 IncludePath，同时吃掉分隔符两侧的空白
+SEMI_SPLIT_RE = re.compile(r'\s*;\s*')
+
 # 日志初始化（可根据需要调整级别和格式）
 logging.basicConfig(
     level=logging.INFO,
@@ -43,83 +73,144 @@ def log_warning(msg: str) -> None:
 def log_error(msg: str) -> None:
     logging.error(msg)
 
+def read_json_file(path: str) -> dict:
+    # 以字节方式读取后直接交给解析器，省去单独的 UTF-8 解码步骤
+    with open(path, 'rb') as f:
+        return json_loads(f.read())
+
+def write_json_file(path: str, data: dict) -> None:
+    # iterencode 逐块产出，边编码边写入，不在内存中拼出完整字符串
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in JSON_ENCODER.iterencode(data):
+            f.write(chunk)
+
 def safe_read_json(path: str) -> dict:
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return read_json_file(path)
     except Exception as e:
         log_error(f"读取 JSON 文件失败: {e}")
         return {}
 
 def safe_write_json(path: str, data: dict) -> None:
     try:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        write_json_file(path, data)
         log_info(f"成功写入 JSON 文件: {path}")
     except Exception as e:
         log_error(f"写入 JSON 文件失败: {e}")
 
-def generate_vscode_config_from_file(input_filepath, config_name):
+@functools.lru_cache(maxsize=4)
+def load_uvprojx_targets(input_filepath, mtime):
+    """
+    流式解析一次 .uvprojx 文件，按 <TargetName> 收集每个 Target 中第一个 <Cads>
+    下 <VariousControls> 的 <IncludePath> 和 <Define> 原始文本。
+
+    mtime 只作为缓存键的一部分，文件被修改后会重新解析；同一文件的多个
+    Target（如 Debug/Release）共用这一次解析结果。
+
+    返回:
+    dict: 按文件中的顺序排列的 {target_name: (include_text, define_text)}。
+    """
+    # 已处理完的元素随即 clear()（lxml 下至少在每个 <Target> 结束时整体释放），
+    # 内存占用不随文件大小增长。
+    targets = {}
+    target_name = None
+    path_text = None
+    define_text = None
+    in_cads = False
+    in_controls = False
+    iterparse_kwargs = {'tag': UVPROJX_TAGS} if HAS_LXML else {}
+
+    for event, el in ET.iterparse(input_filepath, events=('start', 'end'), **iterparse_kwargs):
+        if event == 'start':
+            # 每个 Target 只取第一个 <Cads>（TargetArmAds 下的全局配置）
+            if el.tag == 'Cads' and target_name not in targets:
+                in_cads = True
+                path_text = define_text = None
+            elif in_cads and el.tag == 'VariousControls':
+                in_controls = True
+            continue
+
+        if in_controls:
+            # 与 find('.//VariousControls/IncludePath') 一致：只取第一个匹配项
+            if el.tag == 'IncludePath' and path_text is None:
+                path_text = el.text or ''
+            elif el.tag == 'Define' and define_text is None:
+                define_text = el.text or ''
+            elif el.tag == 'VariousControls':
+                in_controls = False
+        elif in_cads and el.tag == 'Cads':
+            in_cads = False
+            targets[target_name] = (path_text, define_text)
+        elif el.tag == 'TargetName':
+            target_name = el.text
+        elif el.tag == 'Target':
+            target_name = None
+        el.clear()
+
+    return targets
+
+
+def extract_config(targets, target_name=None):
+    """
+    从 load_uvprojx_targets 的结果中取出指定 Target 的 includePath 和 defines。
+
+    参数:
+    targets (dict): load_uvprojx_targets 的返回值。
+    target_name (str): Target 名称，为 None 时取第一个包含 <Cads> 的 Target。
+
+    返回:
+    dict: 包含 'includePath' 和 'defines' 列表的字典，如果找不到则返回 None。
+    """
+    if target_name is None:
+        texts = next(iter(targets.values()), None)
+    else:
+        texts = targets.get(target_name)
+    if texts is None:
+        # print(f"错误: 未找到 Target '{target_name}' 的 <Cads> 节点。")
+        return None
+    path_text, define_text = texts
+
+    extracted_data = {
+        "includePath": [],
+        "defines": []
+    }
+
+    # 提取 <IncludePath> 配置
+    if path_text:
+        # 对整段文本只做一次分隔符替换和切分，再逐项移除开头的 '../'
+        paths = [
+            DOTDOT_RE.sub('', p, count=1)
+            for p in SEMI_SPLIT_RE.split(path_text.translate(SLASH_TABLE).strip())
+            if p
+        ]
+        extracted_data['includePath'] = paths
+
+    # 提取 <Define> 配置
+    if define_text:
+        # 每项只 strip 一次，空项由 filter 剔除
+        defines = list(filter(None, (d.strip() for d in define_text.split(','))))
+        extracted_data['defines'] = defines
+
+    return extracted_data
+
+
+def generate_vscode_config_from_file(input_filepath, config_name, target_name=None):
     """
     从 Keil .uvprojx 文件读取配置，返回提取到的 includePath 和 defines。
 
     参数:
     input_filepath (str): 输入的 .uvprojx 文件路径。
     config_name (str): 用于配置中的名称（现在仅作日志记录）。
+    target_name (str): 要提取的 Target 名称，默认取第一个 Target。
 
     返回:
     dict: 包含 'includePath' 和 'defines' 列表的字典，如果失败则返回 None。
     """
 
-    def normalize_and_clean_path(path):
-        """将路径中的 Windows 分隔符 \\ 替换为 /，并移除开头的 '../'"""
-        # 1. 统一分隔符
-        path = path.replace('\\', '/')
-        # 2. 移除开头的 '../' 前缀
-        while path.startswith('../'):
-            path = path[3:] # 秼除前三个字符 "../"
-        return path
-
     try:
-        # 尝试使用 Keil 项目常用的 'gbk' 编码打开文件，以避免解析错误
-        # ET.parse 并不直接支持 encoding 参数，但可以通过 io.open/ET.fromstring 组合来实现，
-        # 不过为了简洁和与现有代码结构兼容，我们保持 ET.parse()，并依赖其内部的编码猜测，
-        # 仅修复警告部分。
-        tree = ET.parse(input_filepath)
-        root = tree.getroot()
-
-        cads_node = root.find('.//Cads')
-
-        # *** 修复 DeprecationWarning: 使用 'is None' 显式检查节点是否存在 ***
-        if cads_node is None:
-            # 原本这里是被注释掉的，现在修复了布尔检查逻辑
-            # print(f"错误: 在文件 '{input_filepath}' 中未找到 <Cads> 节点。")
-            return None
-
-        extracted_data = {
-            "includePath": [],
-            "defines": []
-        }
-
-        # 提取 <IncludePath> 配置
-        path_node = cads_node.find('.//VariousControls/IncludePath')
-        # if path_node is not None and path_node.text: 保持不变，这是正确的检查方式
-        if path_node is not None and path_node.text:
-            paths = [
-                normalize_and_clean_path(p.strip())
-                for p in path_node.text.split(';')
-                if p.strip()
-            ]
-            extracted_data['includePath'] = paths
-
-        # 提取 <Define> 配置
-        define_node = cads_node.find('.//VariousControls/Define')
-        # if define_node is not None and define_node.text: 保持不变
-        if define_node is not None and define_node.text:
-            defines = [d.strip() for d in define_node.text.split(',') if d.strip()]
-            extracted_data['defines'] = defines
-
-        return extracted_data
+        # 解析结果按 (路径, 修改时间) 缓存，同一文件的多个 Target 只解析一次
+        targets = load_uvprojx_targets(input_filepath, os.path.getmtime(input_filepath))
+        return extract_config(targets, target_name)
 
     except FileNotFoundError:
         print(f"错误: 文件 '{input_filepath}' 不存在。")
@@ -133,58 +224,71 @@ def generate_vscode_config_from_file(input_filepath, config_name):
 
 
 def ensure_vscode_c_cpp_properties(path, create_default=True):
-    """Ensure the .vscode/c_cpp_properties.json exists and return its path.
+    """Return the .vscode/c_cpp_properties.json path and its loaded content.
 
-    If create_default is False, create the file with an empty configurations list
-    instead of a Default configuration.
+    If the file does not exist yet, a template is built in memory only; the
+    caller writes it out once after updating it. If create_default is False,
+    the template has an empty configurations list instead of a Default
+    configuration.
     """
     vscode_dir = Path(path)
-    vscode_dir.mkdir(parents=True, exist_ok=True)
     c_cpp_path = vscode_dir / 'c_cpp_properties.json'
-    if not c_cpp_path.exists():
-        if create_default:
-            configurations = [
-                {
-                    "name": "Default",
-                    "intelliSenseMode": "linux-gcc-arm",
-                    "compilerPath": COMPILER_PATH,
-                    "cStandard": "c99",
-                    "cppStandard": "c++11",
-                    "includePath": [],
-                    "defines": []
-                }
-            ]
-        else:
-            configurations = []
+    # 先直接尝试读取：文件已存在时（常见情况）不再额外 stat 或 mkdir
+    try:
+        return str(c_cpp_path), read_json_file(str(c_cpp_path))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_error(f"读取 JSON 文件失败: {e}")
+        return str(c_cpp_path), {}
+
+    vscode_dir.mkdir(parents=True, exist_ok=True)
+    if create_default:
+        configurations = [
+            {
+                "name": "Default",
+                "intelliSenseMode": "linux-gcc-arm",
+                "compilerPath": COMPILER_PATH,
+                "cStandard": "c99",
+                "cppStandard": "c++11",
+                "includePath": [],
+                "defines": []
+            }
+        ]
+    else:
+        configurations = []
 
-        template = {
-            "configurations": configurations,
-            "version": 4
-        }
-        with open(c_cpp_path, 'w', encoding='utf-8') as f:
-            json.dump(template, f, indent=4, ensure_ascii=False)
-    return str(c_cpp_path)
+    template = {
+        "configurations": configurations,
+        "version": 4
+    }
+    return str(c_cpp_path), template
 
 
-def update_c_cpp_properties(new_data, output_filepath, config_name):
+def update_c_cpp_properties(new_data, output, config_name):
     """
-    读取现有的 c_cpp_properties.json 文件，更新（或创建）指定配置下的
-    includePath 和 defines 字段，并写回文件。
+    更新（或创建）c_cpp_properties.json 中指定配置下的 includePath 和 defines 字段。
+
+    output 可以是文件路径（读取、更新并写回文件），也可以是已加载的配置字典
+    （仅原地修改，由调用方负责写盘）。返回是否更新成功。
     """
 
-    if not os.path.exists(output_filepath):
-        print(f"错误: 文件 '{output_filepath}' 不存在。请先手动创建一个基础配置的 JSON 文件。")
-        return
+    in_memory = isinstance(output, dict)
+    if not in_memory and not os.path.exists(output):
+        print(f"错误: 文件 '{output}' 不存在。请先手动创建一个基础配置的 JSON 文件。")
+        return False
 
     try:
         # 1. 读取现有文件内容 (JSON文件通常使用UTF-8，保持不变)
-        with open(output_filepath, 'r', encoding='utf-8') as f:
-            content = json.load(f)
+        if in_memory:
+            content = output
+        else:
+            content = read_json_file(output)
 
         # 2. 确保 configurations 列表存在
         if 'configurations' not in content or not isinstance(content['configurations'], list):
             print("警告: 现有的 c_cpp_properties.json 缺少 'configurations' 列表，无法更新。")
-            return
+            return False
 
         # 3. 查找或创建目标配置
         target_config = None
@@ -209,16 +313,18 @@ def update_c_cpp_properties(new_data, output_filepath, config_name):
         target_config['includePath'] = new_data.get('includePath', [])
         target_config['defines'] = new_data.get('defines', [])
 
-        # 5. 写回文件
-        with open(output_filepath, 'w', encoding='utf-8') as f:
-            json.dump(content, f, indent=4, ensure_ascii=False)
+        # 5. 写回文件（内存模式下由调用方写盘）
+        if not in_memory:
+            write_json_file(output, content)
 
         print(f"成功更新 c_cpp_properties.json 中配置 '{config_name}' 的 includePath 和 defines。")
+        return True
 
     except json.JSONDecodeError:
-        print(f"错误: 文件 '{output_filepath}' JSON 格式不正确。请检查文件内容。")
+        print(f"错误: 文件 '{output}' JSON 格式不正确。请检查文件内容。")
     except Exception as e:
         print(f"更新文件时发生未知错误: {e}")
+    return False
 
 
 def write_editorconfig_file(output_dir):
@@ -242,24 +348,40 @@ def write_editorconfig_file(output_dir):
         print(f"生成 .editorconfig 文件时发生错误: {e}")
 
 
+def iter_uvprojx_files(start_dir):
+    """
+    按 os.walk 相同的顺序（先当前目录的文件，再逐个子目录）惰性地产出
+    所有以 '.uvprojx' 为后缀的文件路径。
+    使用 os.scandir，DirEntry 自带文件类型信息，无需对每个条目额外 stat。
+    """
+    subdirs = []
+    try:
+        with os.scandir(start_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith('.uvprojx'):
+                    yield entry.path
+    except OSError:
+        # 与 os.walk 默认行为一致：无法访问的目录直接跳过
+        return
+    for subdir in subdirs:
+        yield from iter_uvprojx_files(subdir)
+
+
 def find_uvprojx_files(start_dir):
     """
     遍历目录及子目录，寻找所有以 '.uvprojx' 为后缀的文件。
     """
-    uvprojx_files = []
-    for root, dirs, files in os.walk(start_dir):
-        for file in files:
-            if file.endswith('.uvprojx'):
-                uvprojx_files.append(os.path.join(root, file))
-    return uvprojx_files
+    return list(iter_uvprojx_files(start_dir))
 
 
 def find_first_uvprojx(src_dir: str) -> str | None:
-    files = find_uvprojx_files(src_dir)
-    if not files:
+    # 只需要第一个匹配项，找到即停止遍历
+    path = next(iter_uvprojx_files(src_dir), None)
+    if path is None:
         log_warning(f"在目录 '{src_dir}' 未找到任何 .uvprojx 文件。")
-        return None
-    return files[0]
+    return path
 
 
 def parse_keil_config(uvprojx_path: str, config_name: str) -> dict | None:
@@ -270,12 +392,12 @@ def parse_keil_config(uvprojx_path: str, config_name: str) -> dict | None:
     return data
 
 
-def ensure_vscode_config(vscode_dir: str, create_default: bool) -> str:
+def ensure_vscode_config(vscode_dir: str, create_default: bool) -> tuple[str, dict]:
     return ensure_vscode_c_cpp_properties(vscode_dir, create_default=create_default)
 
 
-def update_vscode_config(data: dict, config_path: str, config_name: str) -> None:
-    update_c_cpp_properties(data, config_path, config_name)
+def update_vscode_config(data: dict, config: str | dict, config_name: str) -> bool:
+    return update_c_cpp_properties(data, config, config_name)
 
 
 def main():
@@ -311,9 +433,11 @@ def main():
     if not data:
         return
     vscode_dir = args.vscode_dir
-    Path(vscode_dir).mkdir(exist_ok=True)
-    config_path = ensure_vscode_config(vscode_dir, args.create_default_config)
-    update_vscode_config(data, config_path, config_name)
+    # 配置在内存中完成创建和更新，最后只写一次磁盘
+    config_path, config = ensure_vscode_config(vscode_dir, args.create_default_config)
+    if not update_vscode_config(data, config, config_name):
+        return
+    safe_write_json(config_path, config)
     log_info("全部流程完成！")
 
 # --- 主程序入口 ---